@@ -1,46 +1,148 @@
 import streamlit as st
+import time
 import pandas as pd
+import numpy as np
+from collections import namedtuple
 
 # 1. Load Data
 st.set_page_config(page_title="Analyst Upside Finder", layout="wide")
 st.title("Stock Analyst Upside Finder")
 
+# Only the columns the table actually shows
+DATA_COLUMNS = [
+    "Ticker", "Price", "Currency", "Target_Price", "Upside_Potential", "Num_Analysts",
+    "Strong_Buy", "Buy", "Hold", "Sell", "Strong_Sell",
+    "Rating", "Sector", "Trailing_PE", "Forward_PE", "Dividend_Yield",
+]
+
+# How each column is labelled/formatted in the results table (built once, not per rerun)
+TABLE_COLUMNS = {
+    "Upside_Potential": st.column_config.NumberColumn("Upside %", format="%.2f %%"),
+    "Price": st.column_config.NumberColumn("Price", format="$%.2f"),
+    "Target_Price": st.column_config.NumberColumn("Target", format="$%.2f"),
+    "Trailing_PE": st.column_config.NumberColumn("Trailing P/E", format="%.1f"),
+    "Forward_PE": st.column_config.NumberColumn("Forward P/E", format="%.1f"),
+    "Sector": "Sector",
+    "Rating": "Rating",
+    "Num_Analysts": "Analysts",
+    "Strong_Buy": st.column_config.NumberColumn("Strong Buy", format="%d 🟢"),
+    "Buy": st.column_config.NumberColumn("Buy", format="%d 🟢"),
+    "Hold": st.column_config.NumberColumn("Hold", format="%d 🟡"),
+    "Sell": st.column_config.NumberColumn("Sell", format="%d 🔴"),
+    "Strong_Sell": st.column_config.NumberColumn("Strong Sell", format="%d 🔴"),
+    "Dividend_Yield": st.column_config.NumberColumn("Div Yield", format="%.2f %%"),
+}
+
+# Smaller types for every column: counts fit in int16, prices/ratios in float32,
+# and the text columns only have a handful of distinct values
+COUNT_COLUMNS = ["Num_Analysts", "Strong_Buy", "Buy", "Hold", "Sell", "Strong_Sell"]
+COLUMN_TYPES = {
+    **{col: "int16" for col in COUNT_COLUMNS},
+    "Upside_Potential": "float32",
+    "Price": "float32",
+    "Target_Price": "float32",
+    "Trailing_PE": "float32",
+    "Forward_PE": "float32",
+    "Dividend_Yield": "float32",
+    "Rating": "category",
+    "Sector": "category",
+    "Currency": "category",
+    "Ticker": "category",
+}
+
+def read_data_file():
+    """Returns (df, file it came from), or (None, None) if nothing could be read"""
+    try:
+        # Read the Parquet file (typed + compressed, much faster than CSV)
+        return pd.read_parquet("stock_data.parquet", columns=DATA_COLUMNS), "stock_data.parquet"
+    except Exception:
+        # Missing, unreadable (e.g. half-written) or pyarrow not installed
+        pass
+    try:
+        # Fall back to the old CSV snapshot (no longer updated by the daily job)
+        return pd.read_csv("stock_data.csv", usecols=DATA_COLUMNS), "stock_data.csv"
+    except Exception:
+        return None, None
+
+# Everything the sidebar and filters need to know about the loaded data
+DataMeta = namedtuple("DataMeta", ["source", "sectors", "ratings", "max_analysts", "analyst_bits", "loaded_at"])
+
 # NEW: Load Data Function with Caching & Clear Logic
-@st.cache_data(ttl="2h") # Cache data for 2 hours automatically
+# cache_resource hands back the same DataFrame on every rerun instead of
+# copying it out of the cache. Nothing below modifies df, so sharing it is safe.
+@st.cache_resource(ttl="2h") # Cache data for 2 hours automatically
 def load_data():
-    try:
-        # Read the CSV
-        return pd.read_csv("stock_data.csv")
-    except FileNotFoundError:
-        return None
+    df, source = read_data_file()
+    if df is None or df.empty:
+        return None, None
+
+    # Missing analyst counts mean "no analysts", ints can't hold NaN
+    df[COUNT_COLUMNS] = df[COUNT_COLUMNS].fillna(0)
+    # Same label fetch_data uses for a missing rating, so the Rating filter can match it
+    df['Rating'] = df['Rating'].fillna('N/A')
+    df = df.astype(COLUMN_TYPES)
+
+    # Widget options are worked out once here and cached with the data,
+    # so a slider tweak doesn't rescan whole columns
+    max_analysts = int(df['Num_Analysts'].max())
+
+    # One packed bit-row per "at least k analysts" slider position (8 stocks per
+    # byte), so that filter becomes a row lookup instead of a column comparison
+    thresholds = np.arange(max_analysts + 1)[:, None]
+
+    meta = DataMeta(
+        source=source,
+        sectors=sorted(df['Sector'].dropna().unique().tolist()),
+        ratings=df['Rating'].unique().tolist(),
+        max_analysts=max_analysts,
+        analyst_bits=np.packbits(df['Num_Analysts'].to_numpy() >= thresholds, axis=1),
+        # Marks this particular load, so other caches know when the data changed
+        loaded_at=time.time(),
+    )
+    return df, meta
+
+def category_mask(column, selected):
+    """isin() for a category column, done on the small integer codes instead of strings"""
+    codes = column.cat.categories.get_indexer(selected)
+    codes = codes[codes >= 0] # -1 means "not a category" (and is also the code for NaN)
+    return np.isin(column.cat.codes.to_numpy(), codes)
+
+@st.cache_data(ttl="2h")
+def sort_order(_df, loaded_at, col, ascending):
+    """Row positions of the full data sorted by one column (NaN last).
+    _df isn't hashed, loaded_at tells the cache which load it belongs to."""
+    return _df[col].reset_index(drop=True).sort_values(ascending=ascending).index.to_numpy()
 
 # Sidebar "Reset" Button
 if st.sidebar.button("🔄 Refresh Data"):
-    st.cache_data.clear() # Wipes the memory
+    load_data.clear() # Wipes the memory
+    st.cache_data.clear() # ...and the cached sort orders
     st.rerun() # Restarts the app instantly
 
-df = load_data() # Use the function instead of direct pd.read_csv
+df, meta = load_data() # Use the function instead of direct pd.read_csv
 
 if df is None:
-    st.error("Data file not found. Please run 'fetch_data.py' first!")
+    st.error("Data file not found or unreadable. Please run 'fetch_data.py' first!")
     st.stop()
 
+if meta.source == "stock_data.csv":
+    st.warning("Showing the old CSV snapshot because 'stock_data.parquet' is missing or unreadable. This data may be out of date.")
+
 # 2. Sidebar Filters
 st.sidebar.header("Filter Options")
 
 # Filter: Sector (New)
-available_sectors = sorted(df['Sector'].dropna().unique())
 selected_sectors = st.sidebar.multiselect(
     "Filter by Sector",
-    options=available_sectors,
-    default=available_sectors
+    options=meta.sectors,
+    default=meta.sectors
 )
 
 # Filter: Minimum Number of Analysts
 min_analysts = st.sidebar.slider(
     "Minimum No. of Analysts", 
     min_value=0, 
-    max_value=int(df['Num_Analysts'].max()), 
+    max_value=meta.max_analysts, 
     value=0
 )
 
@@ -53,18 +155,20 @@ min_div = st.sidebar.number_input("Minimum Dividend Yield (%)", value=0.0)
 # Filter: Rating
 rating_filter = st.sidebar.multiselect(
     "Filter by Rating Label",
-    options=df['Rating'].unique(),
-    default=df['Rating'].unique()
+    options=meta.ratings,
+    default=meta.ratings
 )
 
 # 3. Apply Filters
-filtered_df = df[
-    (df['Num_Analysts'] >= min_analysts) &
-    (df['Upside_Potential'] >= min_upside) &
-    (df['Dividend_Yield'] >= min_div) &
-    (df['Rating'].isin(rating_filter)) &
-    (df['Sector'].isin(selected_sectors))
-]
+# The analyst count comes straight from the precomputed bits for this slider value
+min_analysts, min_upside, min_div = int(min_analysts), float(min_upside), float(min_div)
+mask = np.unpackbits(meta.analyst_bits[min_analysts], count=len(df)).astype(bool)
+# The other numeric checks go through eval() so numexpr can run both comparisons
+# and the AND in a single pass (plain Python numbers only, numexpr is picky)
+mask &= df.eval("Upside_Potential >= @min_upside and Dividend_Yield >= @min_div").to_numpy()
+mask &= category_mask(df['Rating'], rating_filter)
+mask &= category_mask(df['Sector'], selected_sectors)
+
 
 # 4. Sorting Logic
 sort_col = st.radio(
@@ -75,7 +179,9 @@ sort_col = st.radio(
 )
 
 # Handle sorting with NaN values (put missing P/E at bottom usually desired, but standard sort puts them last)
-sorted_df = filtered_df.sort_values(by=sort_col, ascending=(sort_col in ["Forward_PE", "Trailing_PE"]))
+# The full sort order is cached, so each rerun just keeps the rows that pass the mask
+order = sort_order(df, meta.loaded_at, sort_col, sort_col in ["Forward_PE", "Trailing_PE"])
+sorted_df = df.iloc[order[mask[order]]]
 # Note: Usually you want Upside Descending (High to Low), but P/E Ascending (Low to High). 
 # The logic above flips the sort order: False for Upside (High first), True for P/E (Low first).
 
@@ -84,22 +190,7 @@ st.metric("Stocks Found", len(sorted_df))
 
 st.dataframe(
     sorted_df,
-    column_config={
-        "Upside_Potential": st.column_config.NumberColumn("Upside %", format="%.2f %%"),
-        "Price": st.column_config.NumberColumn("Price", format="$%.2f"),
-        "Target_Price": st.column_config.NumberColumn("Target", format="$%.2f"),
-        "Trailing_PE": st.column_config.NumberColumn("Trailing P/E", format="%.1f"),
-        "Forward_PE": st.column_config.NumberColumn("Forward P/E", format="%.1f"),
-        "Sector": "Sector",
-        "Rating": "Rating",
-        "Num_Analysts": "Analysts",
-        "Strong_Buy": st.column_config.NumberColumn("Strong Buy", format="%d 🟢"),
-        "Buy": st.column_config.NumberColumn("Buy", format="%d 🟢"),
-        "Hold": st.column_config.NumberColumn("Hold", format="%d 🟡"),
-        "Sell": st.column_config.NumberColumn("Sell", format="%d 🔴"),
-        "Strong_Sell": st.column_config.NumberColumn("Strong Sell", format="%d 🔴"),
-        "Dividend_Yield": st.column_config.NumberColumn("Div Yield", format="%.2f %%"),
-    },
+    column_config=TABLE_COLUMNS,
     use_container_width=True,
     hide_index=True
 )
@@ -1,9 +1,100 @@
 import yfinance as yf
 import pandas as pd
+import numpy as np
+import os
+import sys
 import time
-import random
+import json
+import math
+import operator
+import pickle
+import shutil
+import hashlib
+import threading
 import requests
+import pyarrow as pa
+import pyarrow.parquet as pq
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from io import StringIO  # Added this to handle the HTML string safely
+from pathlib import Path
+from datetime import date
+
+# Scan settings: how many stocks we work on at once, and how polite we are to Yahoo
+MAX_WORKERS = 32            # threads in the pool
+MAX_IN_FLIGHT = 10          # Yahoo requests allowed at the same time
+MIN_REQUEST_INTERVAL = 0.15 # seconds between starting two Yahoo requests
+FLUSH_EVERY = 50            # rows kept in memory before they are written to disk
+MIN_PUBLISH_RATIO = 0.5     # a new scan needs at least this share of the old row count to replace it
+CHECKPOINT_PATH = "partial.pkl"
+
+# Column layout of stock_data.parquet (fixed up front so a None in the first
+# row can't lock a column into the wrong type)
+SCHEMA = pa.schema([
+    ("Ticker", pa.string()),
+    ("Price", pa.float64()),
+    ("Currency", pa.string()),
+    ("Target_Price", pa.float64()),
+    ("Upside_Potential", pa.float64()),
+    ("Num_Analysts", pa.int64()),
+    ("Strong_Buy", pa.int64()),
+    ("Buy", pa.int64()),
+    ("Hold", pa.int64()),
+    ("Sell", pa.int64()),
+    ("Strong_Sell", pa.int64()),
+    ("Rating", pa.string()),
+    ("Sector", pa.string()),
+    ("Trailing_PE", pa.float64()),
+    ("Forward_PE", pa.float64()),
+    ("Dividend_Yield", pa.float64()),
+])
+
+_yahoo_slots = threading.Semaphore(MAX_IN_FLIGHT)
+_rate_lock = threading.Lock()
+_last_request = 0.0
+
+# Wikipedia pages are saved here so reruns can ask "has it changed?" instead of downloading again
+CACHE_DIR = Path.home() / ".cache" / "stock-analyst"
+
+def get_page(url, headers):
+    """Downloads a page, reusing the saved copy when the server says it hasn't changed (HTTP 304).
+    The cache is best-effort: if it can't be read or written the page is simply downloaded."""
+    page_file = CACHE_DIR / (hashlib.sha1(url.encode()).hexdigest() + ".html")
+    etag_file = CACHE_DIR / "last_etag.json"
+
+    try:
+        validators = json.loads(etag_file.read_text())
+    except (OSError, ValueError):
+        validators = {}
+
+    # Only send the conditional headers if we still have the page they refer to
+    conditional = {}
+    saved = validators.get(url, {})
+    if page_file.exists():
+        if saved.get("etag"):
+            conditional["If-None-Match"] = saved["etag"]
+        if saved.get("last_modified"):
+            conditional["If-Modified-Since"] = saved["last_modified"]
+
+    response = requests.get(url, headers={**headers, **conditional})
+    if response.status_code == 304:
+        try:
+            return page_file.read_text(encoding="utf-8")
+        except OSError:
+            # The saved copy is gone or unreadable after all, ask for the full page
+            response = requests.get(url, headers=headers)
+
+    if response.ok: # never keep an error page around
+        try:
+            CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            page_file.write_text(response.text, encoding="utf-8")
+            validators[url] = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }
+            etag_file.write_text(json.dumps(validators, indent=2))
+        except OSError as e:
+            print(f"Note: could not update the page cache ({e}).")
+    return response.text
 
 def get_sp500_tickers():
     """scrapes the tickers from wikipedia using a browser header"""
@@ -14,11 +105,11 @@ def get_sp500_tickers():
     }
     try:
     # 2. Fetch the content using 'requests' instead of direct pandas
-     response = requests.get(url, headers=headers) #This sends the actual request to the website and downloads the raw HTML code of the page.
+     html = get_page(url, headers) #This sends the actual request to the website and downloads the raw HTML code of the page.
 
     # 3. Use StringIO to pass the HTML text to pandas
     # (This avoids warnings about passing raw strings)
-     tables = pd.read_html(StringIO(response.text)) #returns list of all the tables found on the wiki page
+     tables = pd.read_html(StringIO(html)) #returns list of all the tables found on the wiki page
      df = tables[0] #grabs the first table from that list (index 0) 
     #because on the wiki page the first table is the one that contains the list of S&P 500 companies.
      tickers = [t.replace('.', '-') for t in df['Symbol'].tolist()] #grabs only the Symbol column from the dataframe and converts that column into standard list/array
@@ -32,8 +123,8 @@ def get_nasdaq100_tickers():
     url = "https://en.wikipedia.org/wiki/Nasdaq-100"
     headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"}
     try:
-        response = requests.get(url, headers=headers)
-        tables = pd.read_html(StringIO(response.text))
+        html = get_page(url, headers)
+        tables = pd.read_html(StringIO(html))
         
         # Smart Search for the table with "Ticker" or "Symbol"
         target_df = None
@@ -56,8 +147,8 @@ def get_russell1000_tickers():
     url = "https://en.wikipedia.org/wiki/Russell_1000_Index"
     headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"}
     try:
-        response = requests.get(url, headers=headers)
-        tables = pd.read_html(StringIO(response.text))
+        html = get_page(url, headers)
+        tables = pd.read_html(StringIO(html))
         
         # Smart Search
         target_df = None
@@ -83,8 +174,8 @@ def get_tsx_composite_tickers():
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
     }
     try:
-        response = requests.get(url, headers=headers)
-        tables = pd.read_html(StringIO(response.text))
+        html = get_page(url, headers)
+        tables = pd.read_html(StringIO(html))
         
         #  The data is in the 4th table (Index 3) although it looks like table 3
         if len(tables) < 3:
@@ -131,105 +222,321 @@ def get_custom_tickers():
         "ARKK", "SPY", "QQQ", "IWM", "APLD", "MARA", "CIFR", "IREN", "AEVA", "INOD", "NBIS"
     ]
 
-def fetch_analyst_data(tickers):
-    data_list = []
-    total = len(tickers)
-    
-    print(f"Starting scan for {total} stocks (US & Canada)...")
+# The fields we read from yfinance's .info, grabbed in one C-level call,
+# plus what to use when Yahoo leaves one out
+INFO_FIELDS = (
+    'currentPrice', 'targetMeanPrice', 'dividendYield', 'numberOfAnalystOpinions',
+    'currency', 'recommendationKey', 'sector', 'trailingPE', 'forwardPE',
+)
+INFO_DEFAULTS = {
+    'dividendYield': 0,
+    'numberOfAnalystOpinions': 0,
+    'currency': 'USD',
+    'recommendationKey': 'N/A',
+    'sector': 'Unknown',
+}
+_get_info_fields = operator.itemgetter(*INFO_FIELDS)
+
+def _read_info(info):
+    """Returns the INFO_FIELDS values as a tuple (defaults for any missing keys)"""
+    try:
+        return _get_info_fields(info)
+    except KeyError:
+        return tuple(info.get(key, INFO_DEFAULTS.get(key)) for key in INFO_FIELDS)
+
+def _clean_number(value):
+    """Returns value as a float, or None if it isn't a real finite number
+    (Yahoo sometimes sends things like trailingPE='Infinity')"""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
 
-    for i, ticker in enumerate(tickers):
-        # Retry Logic for Canadian Stocks
-        attempts = [ticker]
-        if ticker.endswith('.TO'):
-            attempts.append(ticker.replace('.TO', '.NE'))
+def _clean_count(value):
+    """Analyst counts as plain ints, anything unusable counts as 0"""
+    number = _clean_number(value)
+    return int(number) if number is not None else 0
 
-        success = False
-        
-        for current_ticker in attempts:
-            if success: break
+def _clean_text(value):
+    return value if isinstance(value, str) else None
+
+def _throttled(func):
+    """Runs one Yahoo call while respecting the shared concurrency cap and min-delay"""
+    global _last_request
+    with _yahoo_slots:
+        with _rate_lock:
+            wait = _last_request + MIN_REQUEST_INTERVAL - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            _last_request = time.monotonic()
+        return func()
+
+def _fetch_one(ticker):
+    """Fetches one stock (with the .NE retry for Canada). Returns a row dict or None"""
+    # Retry Logic for Canadian Stocks
+    attempts = [ticker]
+    if ticker.endswith('.TO'):
+        attempts.append(ticker.replace('.TO', '.NE'))
+
+    for current_ticker in attempts:
+        try:
+            stock = yf.Ticker(current_ticker)
+            info = _throttled(lambda: stock.info)
             
-            try:
-                stock = yf.Ticker(current_ticker)
-                info = stock.info
-                
-                # 1. Get Basic Data
-                current_price = info.get('currentPrice')
-                target_mean = info.get('targetMeanPrice')
+            # 1. Get Basic Data
+            (current_price, target_mean, div_yield, num_analysts,
+             currency, rating, sector, trailing_pe, forward_pe) = _read_info(info)
 
-                div_yield = info.get('dividendYield', 0) 
-                if div_yield is None: div_yield = 0
-                
-                if current_price and target_mean:
-                    upside = ((target_mean - current_price) / current_price) * 100
+            # Only real numbers/strings go into the file, the Parquet schema rejects anything else
+            current_price, target_mean = _clean_number(current_price), _clean_number(target_mean)
+            div_yield = _clean_number(div_yield)
+            trailing_pe, forward_pe = _clean_number(trailing_pe), _clean_number(forward_pe)
+            num_analysts = _clean_count(num_analysts)
+            currency, rating, sector = _clean_text(currency), _clean_text(rating), _clean_text(sector)
+
+            # No price or no analyst target means nothing to rank, try the next attempt
+            if not (current_price and target_mean):
+                continue
+
+            if div_yield is None: div_yield = 0
+
+            # NEW: Fetch ALL Analyst Counts
+            
+            strong_buy = 0
+            buy = 0
+            hold = 0
+            sell = 0
+            strong_sell = 0
+            
+            # No analysts means all 5 counts are 0, so skip the extra request
+            if num_analysts:
+                try:
+                    # Grab the recommendation table
+                    recs = _throttled(lambda: stock.recommendations)
                 
-                if current_price and target_mean:
-                    upside = ((target_mean - current_price) / current_price) * 100
-                    
-                    
-                    # NEW: Fetch ALL Analyst Counts
+                    if recs is not None and not recs.empty:
+                        # Use the first row (latest data)
+                        latest = recs.iloc[0]
                     
-                    strong_buy = 0
-                    buy = 0
-                    hold = 0
-                    sell = 0
-                    strong_sell = 0
+                        # Safely extract all 5 columns
+                        strong_buy = latest.get('strongBuy', 0)
+                        buy = latest.get('buy', 0)
+                        hold = latest.get('hold', 0)
+                        sell = latest.get('sell', 0)
+                        strong_sell = latest.get('strongSell', 0)
                     
-                    try:
-                        # Grab the recommendation table
-                        recs = stock.recommendations
-                        
-                        if recs is not None and not recs.empty:
-                            # Use the first row (latest data)
-                            latest = recs.iloc[0]
-                            
-                            # Safely extract all 5 columns
-                            strong_buy = latest.get('strongBuy', 0)
-                            buy = latest.get('buy', 0)
-                            hold = latest.get('hold', 0)
-                            sell = latest.get('sell', 0)
-                            strong_sell = latest.get('strongSell', 0)
-                            
-                    except Exception:
-                        pass
-                    # -------------------------------------------------------
-
-                    data_list.append({
-                        "Ticker": current_ticker,
-                        "Price": current_price,
-                        "Currency": info.get('currency', 'USD'),
-                        "Target_Price": target_mean,
-                        "Upside_Potential": round(upside, 2),
-                        "Num_Analysts": info.get('numberOfAnalystOpinions', 0),
-                        # ALL 5 CATEGORIES
-                        "Strong_Buy": int(strong_buy),
-                        "Buy": int(buy),
-                        "Hold": int(hold),
-                        "Sell": int(sell),
-                        "Strong_Sell": int(strong_sell),
-                        "Rating": info.get('recommendationKey', 'N/A'),
-                        "Sector": info.get('sector', 'Unknown'),
-                        "Trailing_PE": info.get('trailingPE'),
-                        "Forward_PE": info.get('forwardPE'),
-                        "Dividend_Yield": div_yield
-                    })
-                    
-                    # Print detailed success message so its working
-                    print(f"[{i+1}/{total}] ✅ {current_ticker}")
-                    success = True
-                else:
+                except Exception:
                     pass
+            # -------------------------------------------------------
 
-            except Exception:
-                pass
-        
-        if not success:
-             # Just a small dot for failures to keep console clean
-             print(f"[{i+1}/{total}] ❌ {ticker}")
-        
-        # Sleep is vital for scanning 1500+ stocks
-        time.sleep(random.uniform(0.2, 0.5))
+            return {
+                "Ticker": current_ticker,
+                "Price": current_price,
+                "Currency": currency,
+                "Target_Price": target_mean,
+                "Num_Analysts": num_analysts,
+                # ALL 5 CATEGORIES
+                "Strong_Buy": _clean_count(strong_buy),
+                "Buy": _clean_count(buy),
+                "Hold": _clean_count(hold),
+                "Sell": _clean_count(sell),
+                "Strong_Sell": _clean_count(strong_sell),
+                "Rating": rating,
+                "Sector": sector,
+                "Trailing_PE": trailing_pe,
+                "Forward_PE": forward_pe,
+                "Dividend_Yield": div_yield
+            }
 
-    return pd.DataFrame(data_list)
+        except Exception:
+            pass
+
+    return None
+
+def _rows_to_table(rows):
+    """Turns a batch of row dicts into an Arrow table column by column.
+    Upside is computed here for the whole batch in one NumPy step."""
+    columns = {name: [row[name] for row in rows] for name in SCHEMA.names if name != "Upside_Potential"}
+
+    price = np.array(columns["Price"], dtype=np.float64)
+    target = np.array(columns["Target_Price"], dtype=np.float64)
+    columns["Upside_Potential"] = np.round((target - price) / price * 100, 2)
+
+    return pa.Table.from_pydict(columns, schema=SCHEMA)
+
+def _flush(parts_dir, parts, buffer, done):
+    """Writes the buffered (ticker, row) pairs to their own finished Parquet file
+    in parts_dir, adds the file to parts and the tickers to done, and returns how
+    many rows made it. The buffer is emptied first, so a batch that failed is never
+    retried, and if Arrow rejects the batch the rows are converted one by one so a
+    single bad row only loses itself."""
+    pairs = buffer[:]
+    buffer.clear()
+    if not pairs:
+        return 0
+
+    try:
+        tables = [_rows_to_table([row for _, row in pairs])]
+        kept = pairs
+    except (pa.ArrowException, TypeError, ValueError):
+        tables, kept = [], []
+        for ticker, row in pairs:
+            try:
+                tables.append(_rows_to_table([row]))
+                kept.append((ticker, row))
+            except (pa.ArrowException, TypeError, ValueError) as e:
+                # Left out of done, so a resumed run gives it another try
+                print(f"⚠️ Skipping {row['Ticker']}, bad data: {e}")
+
+    if kept:
+        name = f"part-{len(parts):04d}.parquet"
+        pq.write_table(pa.concat_tables(tables), os.path.join(parts_dir, name), compression="zstd")
+        parts.append(name)
+    done.extend(ticker for ticker, _ in kept)
+    return len(kept)
+
+def _scan_id(tickers):
+    """Today's date plus a hash of the ticker list. A checkpoint only resumes the same scan."""
+    digest = hashlib.sha1("\n".join(tickers).encode()).hexdigest()
+    return f"{date.today().isoformat()}-{digest}"
+
+def _load_checkpoint(scan_id, parts_dir):
+    """Returns (tickers already scanned, part files already written) left by an
+    interrupted run of this same scan, or ([], []) if there is nothing to resume"""
+    try:
+        with open(CHECKPOINT_PATH, "rb") as f:
+            checkpoint = pickle.load(f)
+        if checkpoint.get("scan_id") != scan_id:
+            return [], [] # From another day or another ticker list, don't mix it in
+        for name in checkpoint["parts"]:
+            pq.read_metadata(os.path.join(parts_dir, name)) # raises if missing/broken
+        return list(checkpoint["done"]), list(checkpoint["parts"])
+    except Exception:
+        # Missing or corrupt checkpoint, or a part file is gone: start over
+        return [], []
+
+def _save_checkpoint(scan_id, done, parts):
+    # Write to a temp file first so a crash mid-write can't corrupt the last good checkpoint
+    tmp_path = CHECKPOINT_PATH + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump({"scan_id": scan_id, "done": done, "parts": parts}, f, protocol=5)
+    os.replace(tmp_path, CHECKPOINT_PATH)
+
+def _published_rows(path):
+    """Row count of the currently published file, 0 if there isn't a readable one"""
+    try:
+        return pq.read_metadata(path).num_rows
+    except Exception:
+        return 0
+
+def fetch_analyst_data(tickers, out_path="stock_data.parquet"):
+    """Scans every ticker and saves the good rows to a Parquet file.
+    Every FLUSH_EVERY rows go into their own finished file in out_path + ".parts",
+    and the checkpoint (CHECKPOINT_PATH) is saved right after, so even a hard kill
+    leaves something a rerun on the same day with the same list can resume from.
+    The parts are only joined into out_path once the whole scan has finished,
+    so a failed run never touches the published data. A scan that saves nothing, or
+    fewer than MIN_PUBLISH_RATIO of the published rows, raises RuntimeError instead.
+    Returns the number of rows saved."""
+    total = len(tickers)
+    parts_dir = out_path + ".parts"
+    part_path = out_path + ".tmp"
+    scan_id = _scan_id(tickers)
+
+    # Pick up where an interrupted run left off
+    done, parts = _load_checkpoint(scan_id, parts_dir)
+    if not parts and not done:
+        shutil.rmtree(parts_dir, ignore_errors=True) # leftovers from an unusable run
+    os.makedirs(parts_dir, exist_ok=True)
+
+    already_done = set(done)
+    todo = [t for t in tickers if t not in already_done]
+    buffer = [] # (ticker, row) pairs not written yet
+    saved = sum(pq.read_metadata(os.path.join(parts_dir, name)).num_rows for name in parts)
+
+    if already_done:
+        print(f"Resuming: {total - len(todo)} stocks already scanned, {len(todo)} to go...")
+    else:
+        print(f"Starting scan for {total} stocks (US & Canada)...")
+
+    finished = False
+    # Run the stocks on a pool of threads so we are not waiting on one
+    # network call at a time. _throttled keeps Yahoo from being hammered.
+    # The pool is shut down by hand so Ctrl+C doesn't wait for the whole queue.
+    executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    futures = {}
+    handled = set()
+    try:
+        futures = {executor.submit(_fetch_one, ticker): ticker for ticker in todo}
+
+        for count, future in enumerate(as_completed(futures), start=total - len(todo) + 1):
+            handled.add(future)
+            ticker = futures[future]
+            row = future.result()
+
+            if row is not None:
+                buffer.append((ticker, row))
+                # Print detailed success message so its working
+                print(f"[{count}/{total}] ✅ {row['Ticker']}")
+            else:
+                done.append(ticker) # nothing to write, it's already finished
+                # Just a small dot for failures to keep console clean
+                print(f"[{count}/{total}] ❌ {ticker}")
+
+            if len(buffer) >= FLUSH_EVERY:
+                saved += _flush(parts_dir, parts, buffer, done)
+                _save_checkpoint(scan_id, done, parts)
+
+        finished = True
+    finally:
+        if not finished:
+            # Drop everything still queued; stocks already in flight finish on their own
+            executor.shutdown(wait=False, cancel_futures=True)
+            # Keep the results that came back but weren't handled yet
+            for future, ticker in futures.items():
+                if future in handled or not future.done() or future.cancelled() or future.exception():
+                    continue
+                row = future.result()
+                if row is not None:
+                    buffer.append((ticker, row))
+                else:
+                    done.append(ticker)
+        else:
+            executor.shutdown()
+
+        # Write whatever is left (also on Ctrl+C / errors)
+        try:
+            saved += _flush(parts_dir, parts, buffer, done)
+        finally:
+            # An unfinished scan keeps its checkpoint for next time
+            if not finished:
+                _save_checkpoint(scan_id, done, parts)
+
+    # A scan where most stocks failed (e.g. Yahoo rate-limiting the runner) must not
+    # replace good data. Throw its progress away too, so a rerun really rescans.
+    previous_rows = _published_rows(out_path)
+    if saved == 0 or saved < previous_rows * MIN_PUBLISH_RATIO:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+        if os.path.exists(CHECKPOINT_PATH):
+            os.remove(CHECKPOINT_PATH)
+        raise RuntimeError(
+            f"Only {saved} stocks came back (the published file has {previous_rows}), "
+            f"keeping the old '{out_path}'."
+        )
+
+    # Join the parts one at a time into the final file
+    with pq.ParquetWriter(part_path, SCHEMA, compression="zstd") as writer:
+        for name in parts:
+            writer.write_table(pq.read_table(os.path.join(parts_dir, name)).cast(SCHEMA))
+
+    # Only a complete scan gets published
+    os.replace(part_path, out_path)
+    shutil.rmtree(parts_dir, ignore_errors=True)
+    if os.path.exists(CHECKPOINT_PATH):
+        os.remove(CHECKPOINT_PATH)
+
+    return saved
 
 if __name__ == "__main__":
     # Gather Lists
@@ -241,15 +548,19 @@ if __name__ == "__main__":
 
     print(f"Sources Found: S&P500({len(sp500)}), Nasdaq100({len(nasdaq)}), Russell1000({len(russell)}), TSX({len(tsx)})")
 
-    # Combine and Remove Duplicates (The SET command!)
+    # Combine and Remove Duplicates (dict.fromkeys keeps the first copy and the original order)
     # This creates a master list of unique tickers
-    master_list = list(set(sp500 + nasdaq + russell + tsx + custom))
+    master_list = list(dict.fromkeys(sp500 + nasdaq + russell + tsx + custom))
+    # US stocks first, Canadian (.TO) last, so each region's requests run together
+    master_list.sort(key=lambda t: t.endswith('.TO'))
     
     print(f"Total Unique Stocks after deduplication: {len(master_list)}")
 
-    # Run the Scan
-    df = fetch_analyst_data(master_list)
-
-    # Save
-    df.to_csv("stock_data.csv", index=False)
-    print("\n🎉 Success! Data saved to 'stock_data.csv'. Run 'streamlit run app.py' to view.")
\ No newline at end of file
+    # Run the Scan (saves to Parquet as it goes, keeps the number types and loads much faster than CSV)
+    try:
+        saved = fetch_analyst_data(master_list, "stock_data.parquet")
+    except RuntimeError as e:
+        # Non-zero exit so the daily workflow stops before committing anything
+        print(f"\n❌ Scan failed: {e}")
+        sys.exit(1)
+    print(f"\n🎉 Success! {saved} stocks saved to 'stock_data.parquet'. Run 'streamlit run app.py' to view.")